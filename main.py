@@ -3,12 +3,11 @@ from tkinter import ttk, filedialog, messagebox
 import os
 from pathlib import Path
 import threading
-import zipfile
-import tempfile
 import shutil
-import urllib.request
+import stat
 import re
 import queue
+import io
 
 import json
 
@@ -23,20 +22,32 @@ class UithubCloneApp:
         self.current_root_path = None
         self.temp_dir = None
         self.node_map = {}  # Maps tree item ID to Path object
+        self.node_stats = {}  # Maps tree item ID to (type, size, mtime) taken when the node was listed
         self.default_excludes = {".next", "node_modules", ".git", "dist", "build", ".vscode", "__pycache__", "public", ".idea", "coverage", "venv", "env"}
         self.excludes = self.default_excludes.copy()
+        self.default_clipboard_warn_chars = 5_000_000  # Offer sharding above this many chars
+        self.default_clipboard_max_chars = 20_000_000  # Spill to a temp file above this many chars
         self.msg_queue = queue.Queue()
         self.config_file = Path("config.json")
+        self.snapshot_file = Path("tree_snapshot.json")
+        self.copy_in_progress = False
+        self.spill_file = None  # Temp file holding the last export that was too large for the clipboard
+        self.loaded_source = None  # Path or URL the current tree was loaded from
+        self.loaded_filters = ""  # Filters and excludes in effect when the tree was loaded
+        self.loaded_excludes = set()
+        self.load_generation = 0  # Bumped whenever the shown project changes so stale background work is dropped
         
         self.load_config()
         
         self.setup_styles()
         self.setup_ui()
+        self.restore_snapshot()
         self.start_msg_checker()
         
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def load_config(self):
+        config = {}
         if self.config_file.exists():
             try:
                 with open(self.config_file, 'r') as f:
@@ -45,17 +56,31 @@ class UithubCloneApp:
                     self.last_path = config.get("last_path", str(Path.cwd()))
                     self.last_filters = config.get("filters", "")
             except Exception:
+                config = {}
                 self.last_path = str(Path.cwd())
                 self.last_filters = ""
         else:
             self.last_path = str(Path.cwd())
             self.last_filters = ""
+        
+        # Clipboard limits (in characters), parsed separately so a bad value
+        # doesn't reset the saved path and filters
+        try:
+            self.clipboard_warn_chars = int(config.get("clipboard_warn_chars", self.default_clipboard_warn_chars))
+            self.clipboard_max_chars = int(config.get("clipboard_max_chars", self.default_clipboard_max_chars))
+        except Exception:
+            self.clipboard_warn_chars = self.default_clipboard_warn_chars
+            self.clipboard_max_chars = self.default_clipboard_max_chars
+        self.clipboard_warn_chars = max(1, self.clipboard_warn_chars)
+        self.clipboard_max_chars = max(self.clipboard_warn_chars, self.clipboard_max_chars)
 
     def save_config(self):
         config = {
             "excludes": list(self.excludes),
             "last_path": self.path_var.get(),
-            "filters": self.ext_var.get()
+            "filters": self.ext_var.get(),
+            "clipboard_warn_chars": self.clipboard_warn_chars,
+            "clipboard_max_chars": self.clipboard_max_chars
         }
         try:
             with open(self.config_file, 'w') as f:
@@ -63,8 +88,185 @@ class UithubCloneApp:
         except Exception as e:
             print(f"Failed to save config: {e}")
 
+    def save_snapshot(self):
+        """Stores the visible tree as a compact index: [rel_path, type, size, mtime, expanded].
+        Stats are the ones taken when each node was listed, not the current ones."""
+        root_path = self.current_root_path
+        if not root_path or not self.loaded_source or not self.tree.get_children(""):
+            return
+        
+        nodes = []
+        
+        def walk(item_id):
+            path = self.node_map.get(item_id)
+            node_stat = self.node_stats.get(item_id)
+            if path is None or node_stat is None:  # dummy node or unreadable entry
+                return
+            kind, size, mtime = node_stat
+            rel = path.relative_to(root_path).as_posix()
+            nodes.append([
+                "" if rel == "." else rel,
+                kind,
+                size,
+                mtime,
+                int(bool(self.tree.item(item_id, "open")))
+            ])
+            for child in self.tree.get_children(item_id):
+                walk(child)
+        
+        for item_id in self.tree.get_children(""):
+            walk(item_id)
+        
+        snapshot = {
+            "version": 1,
+            "source": self.loaded_source,
+            "root": str(root_path),
+            "filters": self.loaded_filters,
+            "excludes": sorted(self.loaded_excludes),
+            "nodes": nodes
+        }
+        try:
+            with open(self.snapshot_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, separators=(",", ":"))
+        except Exception as e:
+            print(f"Failed to save tree snapshot: {e}")
+
+    def restore_snapshot(self):
+        """Rebuilds the last session's tree from the snapshot, then revalidates it in the background"""
+        if not self.snapshot_file.exists():
+            return
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            
+            # Only valid for the same source and the same filter settings
+            if (snapshot.get("version") != 1 or
+                    snapshot.get("source") != self.last_path.strip() or
+                    snapshot.get("filters") != self.last_filters or
+                    set(snapshot.get("excludes", [])) != self.excludes or
+                    not snapshot.get("nodes")):
+                return
+            
+            root_path = Path(snapshot["root"])
+            items = {}
+            for rel, kind, size, mtime, expanded in snapshot["nodes"]:
+                if not isinstance(rel, str) or kind not in ("d", "f"):
+                    raise ValueError(f"Invalid snapshot entry: {rel!r}")
+                
+                if not rel:
+                    oid = self.tree.insert("", "end", text=f"📁 {root_path.name}", open=True)
+                    self.node_map[oid] = root_path
+                    self.node_stats[oid] = (kind, size, mtime)
+                    items[rel] = oid
+                    continue
+                
+                parent_id = items.get(rel.rpartition("/")[0])
+                if parent_id is None:
+                    continue
+                name = rel.rpartition("/")[2]
+                if kind == "d":
+                    oid = self.tree.insert(parent_id, "end", text=f"📁 {name}", open=bool(expanded))
+                else:
+                    oid = self.tree.insert(parent_id, "end", text=f"📄 {name}")
+                self.node_map[oid] = root_path / rel
+                self.node_stats[oid] = (kind, size, mtime)
+                items[rel] = oid
+            
+            # Directories that were never expanded get a dummy node to stay expandable
+            for rel, kind, size, mtime, expanded in snapshot["nodes"]:
+                oid = items.get(rel)
+                if kind == "d" and oid and not expanded and not self.tree.get_children(oid):
+                    self.tree.insert(oid, "end", text="dummy")
+            
+            self.current_root_path = root_path
+            self.loaded_source = snapshot["source"]
+            self.loaded_filters = snapshot["filters"]
+            self.loaded_excludes = set(snapshot["excludes"])
+        except Exception as e:
+            print(f"Ignoring tree snapshot: {e}")
+            self.clear_tree()
+            return
+        
+        self.status_var.set(f"Restored: {root_path.name} (checking for changes...)")
+        threading.Thread(target=self._revalidate_thread, args=(snapshot, self.load_generation), daemon=True).start()
+
+    def _revalidate_thread(self, snapshot, generation):
+        root_path = Path(snapshot["root"])
+        try:
+            if not root_path.exists():
+                source = snapshot["source"]
+                if not self.is_github_url(source):
+                    raise ValueError("Path does not exist")
+                if generation == self.load_generation:
+                    self.msg_queue.put(("status", "Downloading GitHub repository..."))
+                root_path = self.download_github_zip(source).resolve()
+            else:
+                changed = False
+                for rel, kind, size, mtime, expanded in snapshot["nodes"]:
+                    try:
+                        info = (root_path / rel).stat()
+                    except OSError:
+                        changed = True
+                        break
+                    if ((kind == "d") != stat.S_ISDIR(info.st_mode) or
+                            (kind == "f" and info.st_size != size) or
+                            info.st_mtime != mtime):
+                        changed = True
+                        break
+                
+                if not changed:
+                    if generation == self.load_generation:
+                        self.msg_queue.put(("status", f"Loaded: {root_path.name}"))
+                    return
+            
+            expanded_paths = [rel for rel, kind, size, mtime, expanded in snapshot["nodes"] if expanded]
+            self.msg_queue.put(("tree_refresh", (generation, root_path, expanded_paths)))
+            
+        except Exception as e:
+            if generation == self.load_generation:
+                self.msg_queue.put(("tree_clear", generation))
+                self.msg_queue.put(("error", f"Could not refresh last session: {e}"))
+                self.msg_queue.put(("status", "Error occurred"))
+
+    def refresh_tree(self, generation, root_path, expanded_paths):
+        if generation != self.load_generation:
+            return
+        
+        self.tree.delete(*self.tree.get_children())
+        self.node_map.clear()
+        self.node_stats.clear()
+        self.load_generation += 1
+        self.current_root_path = root_path
+        self.populate_tree_root(root_path)
+        
+        # Re-open previously expanded directories, parents first
+        path_items = {p: i for i, p in self.node_map.items()}
+        for rel in sorted(expanded_paths, key=lambda r: r.count("/")):
+            path = root_path / rel
+            item_id = path_items.get(path)
+            if not rel or item_id is None:
+                continue
+            self.populate_node(item_id, path)
+            self.tree.item(item_id, open=True)
+            for child in self.tree.get_children(item_id):
+                path_items[self.node_map[child]] = child
+        
+        self.status_var.set(f"Loaded: {root_path.name}")
+
+    def clear_tree(self):
+        """Resets the tree and the loaded project, as after a failed Load"""
+        self.tree.delete(*self.tree.get_children())
+        self.node_map.clear()
+        self.node_stats.clear()
+        self.load_generation += 1
+        self.current_root_path = None
+        self.loaded_source = None
+        self.loaded_filters = ""
+        self.loaded_excludes = set()
+
     def on_closing(self):
         self.save_config()
+        self.save_snapshot()
         self.root.destroy()
 
     def setup_styles(self):
@@ -345,6 +547,13 @@ class UithubCloneApp:
                     self.status_var.set(msg_content)
                 elif msg_type == "tree_root":
                     self.populate_tree_root(msg_content)
+                elif msg_type == "tree_refresh":
+                    self.refresh_tree(*msg_content)
+                elif msg_type == "tree_clear":
+                    if msg_content == self.load_generation:
+                        self.clear_tree()
+                elif msg_type == "copy_ready":
+                    self.finish_copy(msg_content)
         except queue.Empty:
             pass
         finally:
@@ -389,11 +598,13 @@ class UithubCloneApp:
         self.tree.delete(*self.tree.get_children())
         self.content_text.delete(1.0, tk.END)
         self.node_map.clear()
+        self.node_stats.clear()
+        self.load_generation += 1
         self.status_var.set("Working...")
         
-        threading.Thread(target=self._load_thread, args=(path_or_url,), daemon=True).start()
+        threading.Thread(target=self._load_thread, args=(path_or_url, self.ext_var.get(), set(self.excludes)), daemon=True).start()
 
-    def _load_thread(self, path_or_url):
+    def _load_thread(self, path_or_url, filters, excludes):
         try:
             if self.is_github_url(path_or_url):
                 self.msg_queue.put(("status", "Downloading GitHub repository..."))
@@ -404,6 +615,9 @@ class UithubCloneApp:
                     raise ValueError("Path does not exist")
             
             self.current_root_path = root_path.resolve()
+            self.loaded_source = path_or_url
+            self.loaded_filters = filters
+            self.loaded_excludes = excludes
             self.msg_queue.put(("status", f"Loaded: {self.current_root_path.name}"))
             self.msg_queue.put(("tree_root", self.current_root_path))
             
@@ -412,6 +626,11 @@ class UithubCloneApp:
             self.msg_queue.put(("status", "Error occurred"))
 
     def download_github_zip(self, github_url):
+        # Imported lazily to keep startup fast
+        import tempfile
+        import urllib.request
+        import zipfile
+        
         # Cleanup previous temp
         if self.temp_dir and os.path.exists(self.temp_dir):
             try:
@@ -465,9 +684,19 @@ class UithubCloneApp:
         # Populate first level
         self.populate_node(root_node, root_path)
 
+    def record_stat(self, item_id, path):
+        try:
+            info = path.stat()
+        except OSError:
+            self.node_stats.pop(item_id, None)
+            return
+        self.node_stats[item_id] = ("d" if stat.S_ISDIR(info.st_mode) else "f", info.st_size, info.st_mtime)
+
     def populate_node(self, parent_id, path):
         # Clear dummy nodes if any
         self.tree.delete(*self.tree.get_children(parent_id))
+        # Stat before listing, so a later change always shows up as a newer mtime
+        self.record_stat(parent_id, path)
         
         try:
             # Sort: Directories first, then files
@@ -489,12 +718,17 @@ class UithubCloneApp:
                 else:
                     oid = self.tree.insert(parent_id, "end", text=f"📄 {item.name}")
                     self.node_map[oid] = item
+                self.record_stat(oid, item)
                     
         except PermissionError:
             pass
 
-    def check_extension(self, filename):
-        filters = [f.strip() for f in self.ext_var.get().split(",") if f.strip()]
+    def get_filters(self):
+        return [f.strip() for f in self.ext_var.get().split(",") if f.strip()]
+
+    def check_extension(self, filename, filters=None):
+        if filters is None:
+            filters = self.get_filters()
         if not filters:
             return True
         return any(filename.endswith(ext) for ext in filters)
@@ -521,7 +755,10 @@ class UithubCloneApp:
             self.display_file_content(path)
 
     def estimate_tokens(self, text):
-        return len(text) // 4
+        return self.estimate_tokens_from_length(len(text))
+
+    def estimate_tokens_from_length(self, length):
+        return length // 4
 
     def display_file_content(self, path):
         self.content_text.delete(1.0, tk.END)
@@ -542,38 +779,48 @@ class UithubCloneApp:
         except Exception as e:
             self.content_text.insert(1.0, f"Error reading file: {e}")
 
-    def get_all_files(self):
+    def get_all_files(self, filters=None, root_path=None, excludes=None):
         """Generator to yield all files based on current filters"""
-        if not self.current_root_path:
+        if root_path is None:
+            root_path = self.current_root_path
+        if excludes is None:
+            excludes = self.excludes
+        if not root_path:
             return
             
-        stack = [self.current_root_path]
+        stack = [root_path]
         while stack:
             current = stack.pop()
             try:
                 # Sort to ensure deterministic order
                 for item in sorted(current.iterdir(), key=lambda x: x.name.lower(), reverse=True):
-                    if item.name in self.excludes:
+                    if item.name in excludes:
                         continue
                     
                     if item.is_dir():
                         stack.append(item)
                     elif item.is_file():
-                        if self.check_extension(item.name):
+                        if self.check_extension(item.name, filters):
                             yield item
             except PermissionError:
                 continue
 
-    def generate_export_text(self):
-        if not self.current_root_path:
-            return ""
-            
-        output = []
+    def iter_export_chunks(self, stats, filters=None, root_path=None, excludes=None):
+        """Generator yielding export parts (to be joined with newlines).
+        Fills stats["count"] and stats["chars"] as it goes."""
+        if filters is None:
+            filters = self.get_filters()
+        if root_path is None:
+            root_path = self.current_root_path
+        if excludes is None:
+            excludes = self.excludes
+        stats["count"] = 0
+        stats["chars"] = 0
         
         # 1. Tree Structure
-        output.append("=" * 50)
-        output.append(f"PROJECT STRUCTURE: {self.current_root_path.name}")
-        output.append("=" * 50)
+        yield "=" * 50
+        yield f"PROJECT STRUCTURE: {root_path.name}"
+        yield "=" * 50
         
         # Helper to print tree
         def print_tree(directory, prefix=""):
@@ -581,68 +828,207 @@ class UithubCloneApp:
                 items = sorted(directory.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower()))
                 filtered_items = [
                     i for i in items 
-                    if i.name not in self.excludes and 
-                    (i.is_dir() or self.check_extension(i.name))
+                    if i.name not in excludes and 
+                    (i.is_dir() or self.check_extension(i.name, filters))
                 ]
                 
                 for i, item in enumerate(filtered_items):
                     is_last = (i == len(filtered_items) - 1)
                     connector = "└── " if is_last else "├── "
-                    output.append(f"{prefix}{connector}{item.name}")
+                    yield f"{prefix}{connector}{item.name}"
                     
                     if item.is_dir():
                         new_prefix = prefix + ("    " if is_last else "│   ")
-                        print_tree(item, new_prefix)
+                        yield from print_tree(item, new_prefix)
             except PermissionError:
                 pass
 
-        print_tree(self.current_root_path)
-        output.append("\n")
+        yield from print_tree(root_path)
+        yield "\n"
         
         # 2. File Contents
-        output.append("=" * 50)
-        output.append("FILE CONTENTS")
-        output.append("=" * 50)
-        output.append("\n")
-        
-        count = 0
-        total_chars = 0
-        for file_path in self.get_all_files():
+        yield "=" * 50
+        yield "FILE CONTENTS"
+        yield "=" * 50
+        yield "\n"
+        
+        for file_path in self.get_all_files(filters, root_path, excludes):
             try:
-                rel_path = file_path.relative_to(self.current_root_path)
-                output.append(f"📄 FILE: {rel_path}")
-                output.append("-" * 50)
+                rel_path = file_path.relative_to(root_path)
+                yield f"📄 FILE: {rel_path}"
+                yield "-" * 50
                 
                 if file_path.stat().st_size > 100 * 1024:
-                    output.append("(Content skipped - File too large)")
+                    yield "(Content skipped - File too large)"
                 else:
                     content = file_path.read_text(encoding='utf-8', errors='replace')
-                    output.append(content)
-                    total_chars += len(content)
+                    stats["chars"] += len(content)
+                    yield content
                 
-                output.append("\n" + "-" * 50 + "\n")
-                count += 1
+                yield "\n" + "-" * 50 + "\n"
+                stats["count"] += 1
             except Exception as e:
-                output.append(f"(Error reading file: {e})\n")
-        
-        return "\n".join(output), count, total_chars
+                yield f"(Error reading file: {e})\n"
+
+    def generate_export_text(self):
+        if not self.current_root_path:
+            return ""
+            
+        stats = {}
+        text = "\n".join(self.iter_export_chunks(stats))
+        return text, stats["count"], stats["chars"]
 
     def copy_all(self):
         if not self.current_root_path:
             messagebox.showwarning("Warning", "No project loaded")
             return
+        if self.copy_in_progress:
+            self.status_var.set("Export already in progress...")
+            return
             
+        self.copy_in_progress = True
         self.status_var.set("Generating export...")
-        self.root.update()
+        args = (self.get_filters(), self.current_root_path, set(self.excludes), self.load_generation)
+        threading.Thread(target=self._copy_thread, args=args, daemon=True).start()
+
+    def _copy_thread(self, filters, root_path, excludes, generation):
+        """Builds the clipboard payload off the Tk thread, already cut into shards of
+        clipboard_warn_chars. Spills to a temp file once the payload grows past
+        clipboard_max_chars."""
+        import tempfile
+        
+        shard_size = self.clipboard_warn_chars
+        stats = {}
+        shards = []
+        buffer = io.StringIO()
+        buffered = 0
+        spill = None
+        size = 0
+        try:
+            for i, part in enumerate(self.iter_export_chunks(stats, filters, root_path, excludes)):
+                target = spill or buffer
+                if i:
+                    target.write("\n")
+                    size += 1
+                    buffered += 1
+                target.write(part)
+                size += len(part)
+                buffered += len(part)
+                
+                if spill is None and size > self.clipboard_max_chars:
+                    spill = tempfile.NamedTemporaryFile('w', encoding='utf-8', delete=False,
+                                                        prefix='uithub_export_', suffix='.txt')
+                    for shard in shards:
+                        spill.write(shard)
+                    spill.write(buffer.getvalue())
+                    shards = buffer = None
+                elif spill is None and buffered >= shard_size:
+                    # Move full shards out; the tail stays buffered
+                    pieces = self.split_shards(buffer.getvalue(), shard_size)
+                    shards.extend(pieces[:-1])
+                    buffer = io.StringIO(pieces[-1])
+                    buffer.seek(0, io.SEEK_END)
+                    buffered = len(pieces[-1])
+            
+            result = {"generation": generation, "count": stats["count"], "chars": stats["chars"], "size": size}
+            if spill:
+                spill.close()
+                result["file"] = spill.name
+            else:
+                shards.extend(self.split_shards(buffer.getvalue(), shard_size))
+                result["shards"] = shards
+            self.msg_queue.put(("copy_ready", result))
+        except Exception as e:
+            if spill:
+                spill.close()
+                try:
+                    os.unlink(spill.name)
+                except OSError:
+                    pass
+            self.msg_queue.put(("copy_ready", {"generation": generation, "error": str(e)}))
+
+    def remove_spill_file(self):
+        if self.spill_file and os.path.exists(self.spill_file):
+            try:
+                os.unlink(self.spill_file)
+            except OSError:
+                pass
+        self.spill_file = None
+
+    def split_shards(self, text, shard_size):
+        """Splits text into pieces of at most shard_size chars, preferring line breaks"""
+        shard_size = max(1, shard_size)
+        shards = []
+        start = 0
+        while start < len(text):
+            end = min(start + shard_size, len(text))
+            if end < len(text):
+                newline = text.rfind("\n", start, end)
+                if newline > start:
+                    end = newline + 1
+            shards.append(text[start:end])
+            start = end
+        return shards
+
+    def finish_copy(self, result):
+        self.copy_in_progress = False
         
-        text, count, chars = self.generate_export_text()
-        tokens = self.estimate_tokens(text)
+        # The project was reloaded or cleared while exporting
+        if result["generation"] != self.load_generation:
+            if "file" in result:
+                try:
+                    os.unlink(result["file"])
+                except OSError:
+                    pass
+            self.status_var.set("Copy discarded - project changed during export")
+            return
         
-        self.root.clipboard_clear()
-        self.root.clipboard_append(text)
+        if "error" in result:
+            messagebox.showerror("Error", f"Failed to generate export: {result['error']}")
+            self.status_var.set("Error occurred")
+            return
         
+        count, chars, size = result["count"], result["chars"], result["size"]
+        tokens = self.estimate_tokens_from_length(size)
         self.char_count_var.set(f"Chars: {chars}")
         self.token_count_var.set(f"Tokens: ~{tokens}")
+        size_mchars = size / 1_000_000
+        
+        # Too large for the clipboard: hand over the file path instead
+        if "file" in result:
+            # The previous spill file is replaced; this one stays after exit so the copied path keeps working
+            self.remove_spill_file()
+            self.spill_file = result["file"]
+            self.root.clipboard_clear()
+            self.root.clipboard_append(result["file"])
+            self.status_var.set("Export too large for clipboard - copied file path")
+            messagebox.showinfo("Saved to File", f"Export is {size_mchars:.1f}M chars, too large for the clipboard.\nIt was written to:\n{result['file']}\n\nThe file path has been copied to the clipboard.\nFiles: {count}\nEstimated Tokens: ~{tokens}")
+            return
+        
+        shards = result.pop("shards")
+        if len(shards) > 1:
+            answer = messagebox.askyesnocancel("Large Export", f"Export is {size_mchars:.1f}M chars.\n\nYes = copy in shards of {self.clipboard_warn_chars / 1_000_000:.1f}M chars\nNo = copy everything at once")
+            if answer is None:
+                self.status_var.set("Copy cancelled")
+                return
+            if not answer:
+                # Append shard by shard so the full text is never joined in memory
+                self.root.clipboard_clear()
+                for shard in shards:
+                    self.root.clipboard_append(shard)
+                shards = []
+        
+        for i in range(len(shards)):
+            # Release each shard once it is on the clipboard
+            shard, shards[i] = shards[i], None
+            self.root.clipboard_clear()
+            self.root.clipboard_append(shard)
+            if len(shards) > 1:
+                self.status_var.set(f"Copied shard {i + 1}/{len(shards)} to clipboard")
+                if i < len(shards) - 1 and not messagebox.askokcancel("Shard Copied", f"Shard {i + 1}/{len(shards)} copied to clipboard.\nPaste it, then press OK to copy the next shard."):
+                    self.status_var.set(f"Copy stopped after shard {i + 1}/{len(shards)}")
+                    return
+        
         self.status_var.set(f"Copied {count} files to clipboard")
         messagebox.showinfo("Success", f"Copied project tree and {count} files to clipboard.\nTotal Chars: {chars}\nEstimated Tokens: ~{tokens}")
 